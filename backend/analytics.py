@@ -0,0 +1,298 @@
+"""
+Optional columnar store of all matches for cross-user analytics.
+
+Matches are kept as parallel NumPy arrays: tags dictionary-encoded to int32,
+battle time as int64 epoch seconds, crowns and game mode as small ints. Each
+column is a preallocated .npy file mapped with mmap; refreshes append only the
+new rows into the spare capacity and record the row count in meta.json, so
+nothing is rewritten or copied into RAM except when a column has to grow.
+
+Every API process runs the refresh loop, but only the one holding an flock on
+ANALYTICS_DIR/writer.lock writes; the rest re-open the files read-only
+whenever meta.json changes.
+
+Enabled by setting ANALYTICS_DIR; nothing here is imported otherwise.
+"""
+import os
+import json
+import fcntl
+import threading
+
+import numpy as np
+from sqlalchemy import func, BigInteger
+from sqlalchemy.orm import Session
+
+import models
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR")
+LOAD_CHUNK = 50_000
+MIN_CAPACITY = 1 << 16
+# Ids below the high-water mark that are re-read each refresh: a transaction can
+# commit a lower id after a higher one, and those rows would otherwise be skipped
+RESCAN_IDS = 5_000
+
+COLUMNS = {
+    "match_id": np.int64,
+    "p1": np.int32,
+    "p2": np.int32,
+    "time": np.int64,
+    "crowns_1": np.int8,
+    "crowns_2": np.int8,
+    "mode": np.int16,
+}
+
+class H2HStore:
+    def __init__(self, path: str = None, readonly: bool = False):
+        self.path = path # None keeps the columns in plain memory
+        self.readonly = readonly
+        self.rows = 0
+        self.capacity = 0
+        self._data = {name: np.empty(0, dtype=dt) for name, dt in COLUMNS.items()}
+        self.cols = dict(self._data) # read-only views of the first `rows` entries
+        self.tags: list[str] = []
+        self.tag_idx: dict[str, int] = {}
+        self.modes: list[str] = []
+        self.mode_idx: dict[str, int] = {}
+        self.max_id = 0
+        self._recent_ids: set[int] = set() # ids within RESCAN_IDS of max_id, for dedupe
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.rows
+
+    # --- Encoding ---
+    def _encode(self, value, values: list, index: dict) -> int:
+        i = index.get(value)
+        if i is None:
+            i = index[value] = len(values)
+            values.append(value)
+        return i
+
+    def encode_tags(self, tags) -> np.ndarray:
+        """Known tags -> int32 indices; unknown tags are dropped."""
+        return np.fromiter((self.tag_idx[t] for t in tags if t in self.tag_idx), dtype=np.int32)
+
+    # --- Storage ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _reserve(self, n: int):
+        # Grow by doubling; the only time existing rows are copied
+        if self.rows + n <= self.capacity:
+            return
+        cap = max(MIN_CAPACITY, self.capacity * 2, self.rows + n)
+        for name, dt in COLUMNS.items():
+            if self.path:
+                tmp = os.path.join(self.path, f"{name}.tmp.npy")
+                arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=dt, shape=(cap,))
+                arr[:self.rows] = self._data[name][:self.rows]
+                arr.flush()
+                os.replace(tmp, self._file(name))
+            else:
+                arr = np.empty(cap, dtype=dt)
+                arr[:self.rows] = self._data[name][:self.rows]
+            self._data[name] = arr
+        self.capacity = cap
+
+    def _append(self, chunk: dict, n: int):
+        self._reserve(n)
+        end = self.rows + n
+        for name in COLUMNS:
+            self._data[name][self.rows:end] = chunk[name]
+            if self.path:
+                self._data[name].flush()
+        with self._lock:
+            self.rows = end
+            self.cols = {name: self._data[name][:end] for name in COLUMNS}
+
+    def _save_meta(self):
+        meta = {"tags": self.tags, "modes": self.modes, "max_id": self.max_id, "rows": self.rows}
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def reset(self):
+        """Forgets every row. Fresh backing files get allocated on the next append."""
+        with self._lock:
+            self.rows = self.capacity = 0
+            self._data = {name: np.empty(0, dtype=dt) for name, dt in COLUMNS.items()}
+            self.cols = dict(self._data)
+            self.tags, self.tag_idx = [], {}
+            self.modes, self.mode_idx = [], {}
+            self.max_id = 0
+            self._recent_ids = set()
+
+    @classmethod
+    def open(cls, path: str, readonly: bool = False) -> "H2HStore":
+        os.makedirs(path, exist_ok=True)
+        store = cls(path, readonly)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return store
+        with open(meta_path) as f:
+            meta = json.load(f)
+        store._data = {name: np.load(store._file(name), mmap_mode="r" if readonly else "r+") for name in COLUMNS}
+        store.capacity = min(len(a) for a in store._data.values())
+        store.rows = meta["rows"]
+        store.cols = {name: a[:store.rows] for name, a in store._data.items()}
+        store.tags = meta["tags"]
+        store.tag_idx = {t: i for i, t in enumerate(store.tags)}
+        store.modes = meta["modes"]
+        store.mode_idx = {m: i for i, m in enumerate(store.modes)}
+        store.max_id = meta["max_id"]
+        ids = store.cols["match_id"]
+        store._recent_ids = set(ids[ids > store.max_id - RESCAN_IDS].tolist())
+        return store
+
+    # --- Loading ---
+    def load_incremental(self, db: Session) -> int:
+        """Appends matches not yet in the store. Returns the number of new rows."""
+        if self.readonly:
+            raise RuntimeError("read-only analytics store")
+        changed = False
+        db_max = db.query(func.max(models.Match.id)).scalar() or 0
+        if db_max < self.max_id:
+            # matches was truncated or its id sequence restarted
+            print("📊 Analytics store ahead of matches; rebuilding")
+            self.reset()
+            changed = True
+
+        added = 0
+        cursor = max(0, self.max_id - RESCAN_IDS)
+        while True:
+            rows = db.query(
+                models.Match.id, models.Match.player_1_tag, models.Match.player_2_tag,
+                func.extract("epoch", models.Match.battle_time).cast(BigInteger),
+                models.Match.crowns_1, models.Match.crowns_2, models.Match.game_mode,
+            ).filter(models.Match.id > cursor).order_by(models.Match.id).limit(LOAD_CHUNK).all()
+            if not rows:
+                break
+            cursor = rows[-1][0]
+
+            fresh = [r for r in rows if r[0] not in self._recent_ids]
+            if fresh:
+                n = len(fresh)
+                chunk = {name: np.empty(n, dtype=dt) for name, dt in COLUMNS.items()}
+                for i, (mid, p1, p2, t, c1, c2, mode) in enumerate(fresh):
+                    chunk["match_id"][i] = mid
+                    chunk["p1"][i] = self._encode(p1, self.tags, self.tag_idx)
+                    chunk["p2"][i] = self._encode(p2, self.tags, self.tag_idx)
+                    chunk["time"][i] = t
+                    chunk["crowns_1"][i] = c1 or 0
+                    chunk["crowns_2"][i] = c2 or 0
+                    chunk["mode"][i] = self._encode(mode or "unknown", self.modes, self.mode_idx)
+                self._append(chunk, n)
+                added += n
+
+            if cursor > self.max_id:
+                self.max_id = cursor
+                changed = True
+            floor = self.max_id - RESCAN_IDS
+            self._recent_ids = {i for i in self._recent_ids if i > floor}
+            self._recent_ids.update(r[0] for r in fresh if r[0] > floor)
+            if len(rows) < LOAD_CHUNK:
+                break
+
+        if self.path and (added or changed):
+            self._save_meta()
+        return added
+
+    # --- Queries ---
+    def _mask(self, cols, tags=None, since: int = None):
+        mask = np.ones(len(cols["match_id"]), dtype=bool)
+        if tags is not None:
+            idx = self.encode_tags(tags)
+            mask &= np.isin(cols["p1"], idx) & np.isin(cols["p2"], idx)
+        if since is not None:
+            mask &= cols["time"] >= since
+        return mask
+
+    def top_pairs(self, limit: int = 10, tags=None, since: int = None) -> list[dict]:
+        """Pairs that play each other most, optionally within a set of tags."""
+        cols, n_tags = self.cols, len(self.tags) # snapshot; a refresh may swap both
+        mask = self._mask(cols, tags, since)
+        p1, p2 = cols["p1"][mask].astype(np.int64), cols["p2"][mask].astype(np.int64)
+        if not len(p1):
+            return []
+        lo, hi = np.minimum(p1, p2), np.maximum(p1, p2)
+        keys, counts = np.unique(lo * n_tags + hi, return_counts=True)
+        top = np.argsort(counts)[::-1][:limit]
+        return [{
+            "player_1_tag": self.tags[int(keys[i] // n_tags)],
+            "player_2_tag": self.tags[int(keys[i] % n_tags)],
+            "games": int(counts[i]),
+        } for i in top]
+
+    def mode_popularity(self, tags=None, since: int = None) -> list[dict]:
+        cols = self.cols
+        mask = self._mask(cols, tags, since)
+        counts = np.bincount(cols["mode"][mask], minlength=len(self.modes))
+        total = int(counts.sum())
+        order = np.argsort(counts)[::-1]
+        return [{
+            "game_mode": self.modes[i],
+            "games": int(counts[i]),
+            "share": round(float(counts[i]) / total, 4) if total else 0.0,
+        } for i in order if counts[i]]
+
+    def player_summary(self, tag: str, since: int = None) -> dict:
+        i = self.tag_idx.get(tag)
+        if i is None:
+            return {"player_tag": tag, "games": 0, "wins": 0, "losses": 0, "draws": 0}
+        cols = self.cols
+        mask = self._mask(cols, None, since)
+        as_p1 = mask & (cols["p1"] == i)
+        as_p2 = mask & (cols["p2"] == i)
+        mine = np.concatenate([cols["crowns_1"][as_p1], cols["crowns_2"][as_p2]])
+        theirs = np.concatenate([cols["crowns_2"][as_p1], cols["crowns_1"][as_p2]])
+        return {
+            "player_tag": tag,
+            "games": int(len(mine)),
+            "wins": int((mine > theirs).sum()),
+            "losses": int((mine < theirs).sum()),
+            "draws": int((mine == theirs).sum()),
+        }
+
+_store = None
+_writer_lock = None # open lock file while this process is the writer
+_meta_mtime = None
+
+def _become_writer() -> bool:
+    global _writer_lock
+    if _writer_lock is None:
+        f = open(os.path.join(ANALYTICS_DIR, "writer.lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        _writer_lock = f # held until exit; the OS drops it if we die
+    return True
+
+def get_store() -> H2HStore:
+    global _store
+    if _store is None:
+        _store = H2HStore.open(ANALYTICS_DIR, readonly=True) if ANALYTICS_DIR else H2HStore()
+    return _store
+
+def refresh(db: Session) -> int:
+    """Writer appends new matches (returns the number added); readers re-open what it wrote."""
+    global _store, _meta_mtime
+    if not ANALYTICS_DIR:
+        return get_store().load_incremental(db)
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+
+    if _become_writer():
+        if _store is None or _store.readonly:
+            _store = H2HStore.open(ANALYTICS_DIR)
+        return _store.load_incremental(db)
+
+    try:
+        mtime = os.stat(os.path.join(ANALYTICS_DIR, "meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if _store is None or mtime != _meta_mtime:
+        _store = H2HStore.open(ANALYTICS_DIR, readonly=True)
+        _meta_mtime = mtime
+    return 0
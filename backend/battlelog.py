@@ -0,0 +1,123 @@
+import hashlib
+from array import array
+from datetime import datetime, timezone
+
+# Shared battlelog parsing, used by the live sync loop and the bulk importer.
+
+def generate_battle_id(battle_time, p1, p2):
+    # Unique ID based on time and sorted player tags
+    t1, t2 = sorted([p1.replace("#",""), p2.replace("#","")])
+    raw = f"{battle_time}-{t1}-{t2}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+def generate_battle_ids(times, p1_tags, p2_tags) -> list[str]:
+    """Batch form of generate_battle_id; same IDs, without the per-call sort/replace."""
+    md5 = hashlib.md5
+    ids = []
+    for t, a, b in zip(times, p1_tags, p2_tags):
+        a = a.replace("#", "")
+        b = b.replace("#", "")
+        if b < a:
+            a, b = b, a
+        ids.append(md5(f"{t}-{a}-{b}".encode()).hexdigest())
+    return ids
+
+def _days_from_civil(y, m, d):
+    # Howard Hinnant's algorithm: days since 1970-01-01 for a proleptic Gregorian date
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def battle_time_to_epoch(s: str) -> int:
+    """Fixed-format parse of '20260130T192951.000Z' into UTC epoch seconds."""
+    days = _days_from_civil(int(s[0:4]), int(s[4:6]), int(s[6:8]))
+    return days * 86400 + int(s[9:11]) * 3600 + int(s[11:13]) * 60 + int(s[13:15])
+
+class BattleBatch:
+    """
+    Column-oriented batch of parsed battles. Tags/ids/modes are plain lists,
+    numeric columns are typed arrays, so a 25-battle payload costs a handful
+    of allocations instead of 25 dicts or ORM objects.
+    """
+    __slots__ = ("battle_ids", "player_1_tags", "player_2_tags", "epochs",
+                 "game_modes", "crowns_1", "crowns_2")
+
+    def __init__(self):
+        self.battle_ids = []
+        self.player_1_tags = []
+        self.player_2_tags = []
+        self.epochs = array("q")
+        self.game_modes = []
+        self.crowns_1 = array("h")
+        self.crowns_2 = array("h")
+
+    def __len__(self):
+        return len(self.battle_ids)
+
+    def winner(self, i):
+        c1, c2 = self.crowns_1[i], self.crowns_2[i]
+        return self.player_1_tags[i] if c1 > c2 else (self.player_2_tags[i] if c2 > c1 else None)
+
+    def row(self, i) -> dict:
+        return {
+            "battle_id": self.battle_ids[i],
+            "player_1_tag": self.player_1_tags[i],
+            "player_2_tag": self.player_2_tags[i],
+            "winner_tag": self.winner(i),
+            "battle_time": datetime.fromtimestamp(self.epochs[i], timezone.utc),
+            "game_mode": self.game_modes[i],
+            "crowns_1": self.crowns_1[i],
+            "crowns_2": self.crowns_2[i],
+        }
+
+    def rows(self, skip_ids=None):
+        """Yields dicts keyed like models.Match, optionally skipping known battle_ids."""
+        for i, bid in enumerate(self.battle_ids):
+            if skip_ids and bid in skip_ids:
+                continue
+            yield self.row(i)
+
+def parse_battlelog(battles: list, known_tags=None) -> BattleBatch:
+    """
+    Turns a raw /battlelog payload into a BattleBatch.
+    Battles where neither player is in known_tags are dropped before anything
+    else is parsed; pass None to keep all.
+    """
+    batch = BattleBatch()
+    times, p1s, p2s, modes = [], [], [], []
+    epochs, c1s, c2s = batch.epochs, batch.crowns_1, batch.crowns_2
+    for b in battles:
+        try:
+            team = b["team"][0]
+            opp = b["opponent"][0]
+            p1_tag = team["tag"]
+            p2_tag = opp["tag"]
+
+            # Only save if we know one of the players (optimization)
+            if known_tags is not None and p1_tag not in known_tags and p2_tag not in known_tags:
+                continue
+
+            b_time_str = b["battleTime"]
+            epoch = battle_time_to_epoch(b_time_str)
+            c1 = int(team["crowns"])
+            c2 = int(opp["crowns"])
+            mode = b.get("type", "Ladder")
+        except Exception:
+            continue # Skip bad records
+        # Append only once every field parsed, so columns stay aligned
+        epochs.append(epoch)
+        c1s.append(c1)
+        c2s.append(c2)
+        times.append(b_time_str)
+        p1s.append(p1_tag)
+        p2s.append(p2_tag)
+        modes.append(mode)
+
+    batch.battle_ids = generate_battle_ids(times, p1s, p2s)
+    batch.player_1_tags = p1s
+    batch.player_2_tags = p2s
+    batch.game_modes = modes
+    return batch
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: battles/sec for the legacy per-battle sync loop vs parse_battlelog.
+
+Usage:
+    python bench_battlelog.py [--battles 25] [--payloads 4000] [--known 0.3]
+
+The legacy loop is reproduced here as it was in sync_user_matches (minus the
+DB round-trip), building a dict where it used to build a models.Match.
+"""
+import argparse
+import hashlib
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from battlelog import parse_battlelog
+
+def _legacy_parse(battles, known_tags):
+    out = []
+    for b in battles:
+        try:
+            p1_tag = b["team"][0]["tag"]
+            p2_tag = b["opponent"][0]["tag"]
+            if p1_tag not in known_tags and p2_tag not in known_tags:
+                continue
+            b_time_str = b["battleTime"]
+            t1, t2 = sorted([p1_tag.replace("#",""), p2_tag.replace("#","")])
+            bid = hashlib.md5(f"{b_time_str}-{t1}-{t2}".encode()).hexdigest()
+            c1 = b["team"][0]["crowns"]
+            c2 = b["opponent"][0]["crowns"]
+            winner = p1_tag if c1 > c2 else (p2_tag if c2 > c1 else None)
+            out.append(dict(
+                battle_id=bid,
+                player_1_tag=p1_tag,
+                player_2_tag=p2_tag,
+                winner_tag=winner,
+                battle_time=datetime.strptime(b_time_str, "%Y%m%dT%H%M%S.%fZ").replace(tzinfo=timezone.utc),
+                game_mode=b.get("type", "Ladder"),
+                crowns_1=c1,
+                crowns_2=c2,
+            ))
+        except Exception:
+            continue
+    return out
+
+def make_payloads(n_payloads, per_payload, known_ratio, seed=7):
+    rnd = random.Random(seed)
+    alphabet = "0289PYLQGRJCUV"
+    tags = ["#" + "".join(rnd.choice(alphabet) for _ in range(9)) for _ in range(2000)]
+    known = set(tags[:int(len(tags) * known_ratio)])
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    payloads = []
+    for _ in range(n_payloads):
+        me = rnd.choice(tags)
+        battles = []
+        for _ in range(per_payload):
+            t = base + timedelta(seconds=rnd.randrange(90 * 86400))
+            battles.append({
+                "type": rnd.choice(["PvP", "friendly", "pathOfLegend", "clanMate"]),
+                "battleTime": t.strftime("%Y%m%dT%H%M%S.000Z"),
+                "team": [{"tag": me, "crowns": rnd.randint(0, 3)}],
+                "opponent": [{"tag": rnd.choice(tags), "crowns": rnd.randint(0, 3)}],
+            })
+        payloads.append(battles)
+    return payloads, known
+
+def run(fn, payloads, known):
+    start = time.perf_counter()
+    kept = 0
+    for p in payloads:
+        kept += len(fn(p, known))
+    return time.perf_counter() - start, kept
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--battles", type=int, default=25, help="Battles per payload")
+    parser.add_argument("--payloads", type=int, default=4000)
+    parser.add_argument("--known", type=float, default=0.3, help="Fraction of tags registered")
+    args = parser.parse_args()
+
+    payloads, known = make_payloads(args.payloads, args.battles, args.known)
+    total = args.payloads * args.battles
+
+    # Sanity: both paths must agree on ids and timestamps
+    for p in payloads[:50]:
+        legacy = _legacy_parse(p, known)
+        fast = list(parse_battlelog(p, known).rows())
+        assert legacy == fast, "parser output diverged from legacy loop"
+
+    legacy_s, kept = run(_legacy_parse, payloads, known)
+    fast_s, _ = run(parse_battlelog, payloads, known)
+    # Includes materializing rows, which the sync path does for new battles only
+    rows_s, _ = run(lambda p, k: list(parse_battlelog(p, k).rows()), payloads, known)
+
+    print(f"{total} battles, {kept} kept ({args.known:.0%} of tags known)")
+    print(f"  legacy loop      : {total / legacy_s:>12,.0f} battles/sec")
+    print(f"  parse_battlelog  : {total / fast_s:>12,.0f} battles/sec  ({legacy_s / fast_s:.1f}x)")
+    print(f"  parse + rows()   : {total / rows_s:>12,.0f} battles/sec  ({legacy_s / rows_s:.1f}x)")
+
+if __name__ == "__main__":
+    main()
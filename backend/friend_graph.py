@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import Counter
+
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import models
+
+# In-memory adjacency index of the friendship graph. Writes go to the DB first
+# and then into the index; each process also reloads periodically so
+# friendships made on other workers show up. Readers copy under the lock since
+# add() mutates the sets from threadpool requests.
+
+RELOAD_INTERVAL = 300 # seconds
+
+class FriendGraph:
+    def __init__(self):
+        self._adj: dict[int, set[int]] = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock() # one load at a time
+        self._added_during_load = None # pairs add()ed while a load is reading the table
+        self.loaded_at = 0.0
+
+    def load(self, db: Session):
+        with self._reload_lock:
+            with self._lock:
+                self._added_during_load = []
+            try:
+                adj: dict[int, set[int]] = {}
+                for u1, u2 in db.query(models.Friendship.user_id_1, models.Friendship.user_id_2):
+                    adj.setdefault(u1, set()).add(u2)
+                    adj.setdefault(u2, set()).add(u1)
+                with self._lock:
+                    # The SELECT may predate these; don't drop them until the next reload
+                    for u1, u2 in self._added_during_load:
+                        adj.setdefault(u1, set()).add(u2)
+                        adj.setdefault(u2, set()).add(u1)
+                    self._adj = adj
+            finally:
+                with self._lock:
+                    self._added_during_load = None
+            self.loaded_at = time.monotonic()
+
+    def reload_if_stale(self, db: Session):
+        if time.monotonic() - self.loaded_at > RELOAD_INTERVAL:
+            self.load(db)
+
+    def add(self, u1: int, u2: int):
+        with self._lock:
+            self._adj.setdefault(u1, set()).add(u2)
+            self._adj.setdefault(u2, set()).add(u1)
+            if self._added_during_load is not None:
+                self._added_during_load.append((u1, u2))
+
+    def are_friends(self, u1: int, u2: int) -> bool:
+        return u2 in self._adj.get(u1, ())
+
+    def friends_of(self, uid: int) -> set[int]:
+        with self._lock:
+            return set(self._adj.get(uid, ()))
+
+    def suggestions(self, uid: int, limit: int = 10) -> list[tuple[int, int]]:
+        """Friends-of-friends ranked by mutual friend count: [(user_id, mutuals)]."""
+        with self._lock:
+            direct = set(self._adj.get(uid, ()))
+            second = [tuple(self._adj.get(f, ())) for f in direct]
+        mutuals = Counter()
+        for fofs in second:
+            for fof in fofs:
+                if fof != uid and fof not in direct:
+                    mutuals[fof] += 1
+        return mutuals.most_common(limit)
+
+graph = FriendGraph()
+
+def add_friendship(db: Session, a: int, b: int) -> bool:
+    """Inserts the (sorted) pair, ignoring duplicates, and updates the index. False if a == b."""
+    u1, u2 = sorted([a, b])
+    if u1 == u2:
+        return False
+    # No conflict target, so this also works before migrate.py has added unique_friendship
+    stmt = pg_insert(models.Friendship).values(user_id_1=u1, user_id_2=u2)
+    db.execute(stmt.on_conflict_do_nothing())
+    db.commit()
+    graph.add(u1, u2)
+    return True
@@ -0,0 +1,214 @@
+"""
+Bulk historical import.
+
+Loads archived /battlelog JSON captures (or the pg_dump seed in local_data.sql)
+through COPY into a staging table, then merges into `matches`, skipping any
+battle_id we already have.
+
+Usage:
+    python importer.py battlelogs ./dumps [./more_dumps ...] [--all-tags]
+    python importer.py seed ../local_data.sql
+"""
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import models
+import database
+from battlelog import parse_battlelog
+from migrate import run_migrations
+import stats_engine
+
+MATCH_COLUMNS = (
+    "battle_id", "player_1_tag", "player_2_tag", "winner_tag",
+    "battle_time", "game_mode", "crowns_1", "crowns_2",
+)
+COPY_CHUNK_ROWS = 50_000
+
+INSERT_RE = re.compile(r"^INSERT INTO (?:public\.)?(\w+) \(([^)]*)\) VALUES \((.*)\);\s*$")
+SQL_VALUE_RE = re.compile(r"'((?:[^']|'')*)'|(NULL)|(-?\d+(?:\.\d+)?)")
+
+# --- Readers ---
+def iter_battlelog_files(paths):
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            yield from sorted(p.rglob("*.json"))
+        elif p.suffix == ".json":
+            yield p
+
+def read_battlelogs(paths, known_tags):
+    """Yields match rows from saved battlelog payloads via the live sync parser."""
+    for path in iter_battlelog_files(paths):
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Skipping {path}: {e}")
+            continue
+        # Accept both the raw list and a wrapped {"items": [...]} capture
+        if isinstance(payload, dict):
+            payload = payload.get("items", [])
+        yield from parse_battlelog(payload, known_tags).rows()
+
+def parse_sql_values(raw: str) -> list:
+    values = []
+    for m in SQL_VALUE_RE.finditer(raw):
+        text, null, num = m.groups()
+        if null:
+            values.append(None)
+        elif num is not None:
+            values.append(int(num) if "." not in num else float(num))
+        else:
+            values.append(text.replace("''", "'"))
+    return values
+
+def read_seed(path):
+    """
+    Splits a pg_dump data-only file into match rows (for COPY) and the
+    remaining (table, row) pairs (users, friendships, ...) which are small.
+    """
+    match_rows, other_rows = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            m = INSERT_RE.match(line)
+            if not m:
+                continue
+            table, cols, raw = m.groups()
+            row = dict(zip([c.strip() for c in cols.split(",")], parse_sql_values(raw)))
+            if table == "matches":
+                match_rows.append({c: row.get(c) for c in MATCH_COLUMNS})
+            else:
+                other_rows.append((table, row))
+    return match_rows, other_rows
+
+def insert_seed_rows(conn, rows):
+    # Dumps can carry columns the live models don't have (e.g. invites.expires_at)
+    tables = models.Base.metadata.tables
+    with conn.cursor() as cur:
+        for table, row in rows:
+            if table not in tables:
+                continue
+            row = {k: v for k, v in row.items() if k in tables[table].c}
+            cols = ", ".join(row)
+            marks = ", ".join(["%s"] * len(row))
+            cur.execute(
+                f"INSERT INTO {table} ({cols}) VALUES ({marks}) ON CONFLICT DO NOTHING",
+                list(row.values()),
+            )
+
+# --- Loader ---
+def _copy_chunk(cur, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        bt = r["battle_time"]
+        writer.writerow([
+            r["battle_id"], r["player_1_tag"], r["player_2_tag"], r["winner_tag"],
+            bt.isoformat() if hasattr(bt, "isoformat") else bt,
+            r["game_mode"], r["crowns_1"], r["crowns_2"],
+        ])
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY matches_staging ({', '.join(MATCH_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf
+    )
+
+def bulk_load_matches(conn, rows) -> tuple[int, int]:
+    """COPY rows into a temp staging table and merge. Returns (staged, inserted)."""
+    cols = ", ".join(MATCH_COLUMNS)
+    staged = 0
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TEMP TABLE matches_staging ON COMMIT DROP AS "
+            f"SELECT {cols} FROM matches WITH NO DATA"
+        )
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= COPY_CHUNK_ROWS:
+                _copy_chunk(cur, chunk)
+                staged += len(chunk)
+                chunk = []
+        if chunk:
+            _copy_chunk(cur, chunk)
+            staged += len(chunk)
+
+        # DISTINCT ON guards against the same battle appearing in two captures
+        cur.execute(
+            f"INSERT INTO matches ({cols}) "
+            f"SELECT DISTINCT ON (battle_id) {cols} FROM matches_staging "
+            f"ON CONFLICT (battle_id) DO NOTHING"
+        )
+        inserted = cur.rowcount
+    return staged, inserted
+
+def rebuild_derived(conn):
+    # Keep sequences and planner stats in line after a bulk load
+    with conn.cursor() as cur:
+        for table in ("users", "friendships", "invites", "matches"):
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+            )
+        cur.execute("ANALYZE matches")
+
+def load_known_tags(conn) -> set:
+    with conn.cursor() as cur:
+        cur.execute("SELECT player_tag FROM users WHERE player_tag IS NOT NULL")
+        return {r[0] for r in cur.fetchall()}
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import historical battles")
+    sub = parser.add_subparsers(dest="source", required=True)
+
+    p_logs = sub.add_parser("battlelogs", help="Directories/files of saved battlelog JSON")
+    p_logs.add_argument("paths", nargs="+")
+    p_logs.add_argument("--all-tags", action="store_true",
+                        help="Keep battles even if neither player is registered")
+
+    p_seed = sub.add_parser("seed", help="pg_dump data file such as local_data.sql")
+    p_seed.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    run_migrations()
+    conn = database.engine.raw_connection()
+    start = time.perf_counter()
+    try:
+        if args.source == "seed":
+            rows, other_rows = read_seed(args.path)
+            insert_seed_rows(conn, other_rows)
+        else:
+            known_tags = None if args.all_tags else load_known_tags(conn)
+            rows = read_battlelogs(args.paths, known_tags)
+
+        staged, inserted = bulk_load_matches(conn, rows)
+        rebuild_derived(conn)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Import failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    if inserted:
+        db = database.SessionLocal()
+        try:
+            pairs = stats_engine.rebuild_all(db)
+            print(f"📈 Rebuilt head-to-head stats for {pairs} pairs")
+        finally:
+            db.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Imported {inserted} new matches ({staged} staged) in {elapsed:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,31 @@
 import os
-import hashlib
-import requests
 import asyncio
 import secrets
+import time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import List, Optional
 
 from fastapi import FastAPI, Depends, HTTPException, status, Body, BackgroundTasks
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+
+# Heavy stacks (jose, passlib, fastapi_mail, requests) are imported on first
+# use so cold starts only pay for what a request actually needs.
 
 # Import local modules (ensure models.py and schemas.py exist)
 import models
 import schemas
 import database
+import metrics
+import passwords
+import sync_queue
+import stats_engine
+from friend_graph import graph as friend_graph, add_friendship
+from battlelog import parse_battlelog
 
 # --- Configuration ---
 def get_env(key, default=None):
@@ -34,26 +41,36 @@ def get_env(key, default=None):
 SECRET_KEY = get_env("SECRET_KEY", "dev_unsafe_secret")
 CR_API_KEY = get_env("CR_API_KEY") 
 FRONTEND_URL = get_env("FRONTEND_URL", "http://localhost:3000")
-API_BASE = "https://proxy.royaleapi.dev/v1"
+API_BASE = get_env("CR_API_BASE", "https://proxy.royaleapi.dev/v1")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+AUTO_MIGRATE = get_env("AUTO_MIGRATE", "0") == "1" # otherwise run `python migrate.py` per deploy
+RUN_SYNC_LOOP = get_env("RUN_SYNC_LOOP", "1") == "1"
+ANALYTICS_DIR = get_env("ANALYTICS_DIR", "") # enables the columnar analytics store (needs numpy)
 
 # Mail Config
-mail_conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME", "user"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", "pass"),
-    MAIL_FROM=os.getenv("MAIL_FROM", "noreply@clashfriends.com"),
-    MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
-    MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=False 
-)
+@lru_cache(maxsize=None)
+def get_mail_conf():
+    from fastapi_mail import ConnectionConfig
+    return ConnectionConfig(
+        MAIL_USERNAME=os.getenv("MAIL_USERNAME", "user"),
+        MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", "pass"),
+        MAIL_FROM=os.getenv("MAIL_FROM", "noreply@clashfriends.com"),
+        MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
+        MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
+        MAIL_STARTTLS=True,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=False 
+    )
 
-# Database & App Init
-models.Base.metadata.create_all(bind=database.engine)
+# App Init (schema work lives in migrate.py)
 app = FastAPI(title="ClashFriends API")
+app_state = {"ready": False}
+
+# Observability
+metrics.instrument_engine(database.engine)
+app.middleware("http")(metrics.metrics_middleware)
 
 # CORS Security
 origins = [
@@ -71,17 +88,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Auth Helpers
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Auth Helpers (password hashing lives in passwords.py)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
-
-def get_hash(password):
-    return pwd_context.hash(password)
-
 def create_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
@@ -98,23 +109,22 @@ def get_db():
 def fetch_cr_player(tag: str):
     if not CR_API_KEY:
         return None
+    import requests
     clean_tag = tag.replace("#", "%23")
+    started = time.perf_counter()
     try:
         resp = requests.get(f"{API_BASE}/players/{clean_tag}", headers={"Authorization": f"Bearer {CR_API_KEY}"}, timeout=5)
+        metrics.record_cr_call("player", started, resp.status_code)
         if resp.status_code == 200:
             return resp.json()
     except Exception as e:
+        metrics.record_cr_call("player", started, "error")
         print(f"CR API Fail: {e}")
     return None
 
-def generate_battle_id(battle_time, p1, p2):
-    # Unique ID based on time and sorted player tags
-    t1, t2 = sorted([p1.replace("#",""), p2.replace("#","")])
-    raw = f"{battle_time}-{t1}-{t2}"
-    return hashlib.md5(raw.encode()).hexdigest()
-
 # --- Dependencies ---
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    from jose import JWTError, jwt
     auth_exception = HTTPException(status_code=401, detail="Invalid credentials", headers={"WWW-Authenticate": "Bearer"})
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -128,91 +138,234 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return user
 
 # --- Background Sync Logic ---
-async def sync_user_matches(db: Session, user: models.User, known_tags: set):
-    if not user.player_tag or not CR_API_KEY: return
+async def sync_user_matches(db: Session, user: models.User, known_tags: set) -> int:
+    """Fetches the user's battlelog and stores new matches. Returns the number inserted."""
+    if not user.player_tag or not CR_API_KEY: return 0
+    import requests
     
     clean_tag = user.player_tag.replace("#", "%23")
     url = f"{API_BASE}/players/{clean_tag}/battlelog"
     headers = {"Authorization": f"Bearer {CR_API_KEY}"}
     
+    tag = user.player_tag
+    result, inserted = "error", 0
+    started = time.perf_counter()
     try:
         # Run synchronous request in thread to avoid blocking loop
         resp = await asyncio.to_thread(requests.get, url, headers=headers, timeout=10)
+        metrics.record_cr_call("battlelog", started, resp.status_code)
         
         if resp.status_code == 429:
             print(f"⚠️ Rate Limit. Skipping {user.username}")
-            return
-        if resp.status_code != 200:
-            return
-
-        battles = resp.json()
-        for b in battles:
-            try:
-                # Basic parsing
-                p1_tag = b["team"][0]["tag"]
-                p2_tag = b["opponent"][0]["tag"]
-                
-                # Only save if we know one of the players (optimization)
-                if p1_tag not in known_tags and p2_tag not in known_tags:
-                    continue
-
-                b_time_str = b["battleTime"]
-                bid = generate_battle_id(b_time_str, p1_tag, p2_tag)
-                
-                if db.query(models.Match).filter_by(battle_id=bid).first():
-                    continue
-                
-                # Determine winner
-                c1 = b["team"][0]["crowns"]
-                c2 = b["opponent"][0]["crowns"]
-                winner = p1_tag if c1 > c2 else (p2_tag if c2 > c1 else None)
-                
-                match_obj = models.Match(
-                    battle_id=bid,
-                    player_1_tag=p1_tag,
-                    player_2_tag=p2_tag,
-                    winner_tag=winner,
-                    battle_time=datetime.strptime(b_time_str, "%Y%m%dT%H%M%S.%fZ").replace(tzinfo=timezone.utc),
-                    game_mode=b.get("type", "Ladder"),
-                    crowns_1=c1,
-                    crowns_2=c2
-                )
-                db.add(match_obj)
-            except Exception:
-                continue # Skip bad records
-        db.commit()
+            result = "rate_limited"
+        elif resp.status_code != 200:
+            result = "http_error"
+        else:
+            batch = parse_battlelog(resp.json(), known_tags)
+
+            # One IN lookup instead of a query per battle
+            existing = {bid for (bid,) in db.query(models.Match.battle_id).filter(
+                models.Match.battle_id.in_(batch.battle_ids))} if batch else set()
+            new_rows = list(batch.rows(skip_ids=existing))
+            for row in new_rows:
+                db.add(models.Match(**row))
+            # Same transaction as the matches: both land or neither does
+            stats_engine.record_matches(db, new_rows)
+            db.commit()
+            result, inserted = "ok", len(new_rows)
     except Exception as e:
+        if isinstance(e, requests.RequestException):
+            metrics.record_cr_call("battlelog", started, "error")
         print(f"Sync error for {user.username}: {e}")
         db.rollback()
 
+    try:
+        sync_queue.record_checkpoint(db, tag, result, inserted)
+    except Exception as e:
+        print(f"Checkpoint failed for {tag}: {e}")
+        db.rollback()
+    return inserted
+
 async def background_sync_task():
+    """
+    Continuous sweep driven by sync_checkpoints: each pass takes the tags that
+    have waited longest (never-synced first), so a restarted worker picks up
+    where the last one stopped instead of starting over. Passes are at least
+    SWEEP_GAP apart, so a sweep is a real batch rather than whichever tag just
+    came due, and the sweep metrics/logs stay meaningful.
+    """
     await asyncio.sleep(5) # Startup buffer
     while True:
-        print("🔄 Running Background Sync...")
+        if not CR_API_KEY:
+            await asyncio.sleep(300)
+            continue
         db = database.SessionLocal()
+        sweep_start = time.perf_counter()
+        inserted = 0
+        synced = 0
         try:
-            users = db.query(models.User).filter(models.User.player_tag != None).all()
-            known_tags = {u.player_tag for u in users}
-            
-            for user in users:
-                await sync_user_matches(db, user, known_tags)
-                await asyncio.sleep(0.5) # Throttle requests
-                
+            sync_queue.register_tags(db)
+            with metrics.SyncProfiler():
+                # Small claimed batches: parallel workers and overlapping deploys never share a tag
+                while users := sync_queue.claim_due_users(db, limit=25):
+                    if synced == 0:
+                        print("🔄 Running Background Sync...")
+                    known_tags = sync_queue.get_known_tags(db)
+                    for user in users:
+                        try:
+                            inserted += await sync_user_matches(db, user, known_tags)
+                        except Exception as e:
+                            print(f"Sync error for {user.player_tag}: {e}")
+                            db.rollback()
+                            sync_queue.record_checkpoint(db, user.player_tag, "error")
+                        synced += 1
+                        await asyncio.sleep(0.5) # Throttle requests
+            wait = max(sync_queue.next_due_in(db), sync_queue.SWEEP_GAP.total_seconds())
         except Exception as e:
-            print(f"Fatal Sync Error: {e}")
+            print(f"Sweep error: {e}")
+            db.rollback()
+            wait = 30
         finally:
             db.close()
         
-        print("✅ Sync finished. Sleeping 30m.")
-        await asyncio.sleep(1800)
+        if synced:
+            metrics.SYNC_SWEEP_DURATION.observe(time.perf_counter() - sweep_start)
+            metrics.SYNC_MATCHES_INSERTED.observe(inserted)
+            print(f"✅ Sync finished ({synced} tags, {inserted} new matches).")
+        await asyncio.sleep(wait)
+
+async def run_sync_job(db: Session, tag: str) -> int:
+    user = db.query(models.User).filter_by(player_tag=tag).first()
+    if not user: return 0
+
+    # Refresh Profile
+    data = await asyncio.to_thread(fetch_cr_player, tag)
+    if data:
+        user.username = data.get("name", user.username)
+        user.trophies = data.get("trophies", user.trophies)
+        db.commit()
+
+    return await sync_user_matches(db, user, sync_queue.get_known_tags(db))
+
+async def sync_job_worker():
+    last_evict = 0.0
+    while True:
+        db = database.SessionLocal()
+        try:
+            if time.monotonic() - last_evict > 60:
+                sync_queue.evict_expired(db)
+                await asyncio.to_thread(friend_graph.reload_if_stale, db)
+                last_evict = time.monotonic()
+
+            job = sync_queue.claim_next(db)
+            if job is None:
+                await asyncio.sleep(1)
+                continue
+
+            job_id, tag = job
+            try:
+                inserted = await run_sync_job(db, tag)
+                sync_queue.finish(db, job_id, inserted)
+            except Exception as e:
+                print(f"Sync job {job_id} failed: {e}")
+                db.rollback()
+                sync_queue.finish(db, job_id, 0, ok=False)
+        except Exception as e:
+            print(f"Sync worker error: {e}")
+            await asyncio.sleep(5)
+        finally:
+            db.close()
+
+def warm_up():
+    from migrate import run_migrations, missing_schema
+    if AUTO_MIGRATE:
+        run_migrations()
+    # Stay unready rather than serve 500s from tables that were never created
+    missing = missing_schema()
+    if missing:
+        raise RuntimeError(f"schema not migrated, missing {', '.join(missing)}; run `python migrate.py`")
+    db = database.SessionLocal()
+    try:
+        friend_graph.load(db)
+    finally:
+        db.close()
+
+async def warm_up_task():
+    # Retry instead of failing startup when the DB is briefly unreachable
+    delay = 1
+    while True:
+        try:
+            await asyncio.to_thread(warm_up)
+            break
+        except Exception as e:
+            print(f"⚠️  Warm-up failed ({e}). Retrying in {delay}s.")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    app_state["ready"] = True
+    print("✅ Ready.")
+    asyncio.create_task(sync_job_worker())
+    if RUN_SYNC_LOOP:
+        asyncio.create_task(background_sync_task())
+    if ANALYTICS_DIR:
+        asyncio.create_task(analytics_refresh_task())
+
+def refresh_analytics():
+    import analytics
+    db = database.SessionLocal()
+    try:
+        return analytics.refresh(db)
+    finally:
+        db.close()
+
+async def analytics_refresh_task():
+    while True:
+        try:
+            added = await asyncio.to_thread(refresh_analytics)
+            if added: print(f"📊 Analytics store +{added} matches")
+        except Exception as e:
+            print(f"Analytics refresh failed: {e}")
+        await asyncio.sleep(60)
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(background_sync_task())
+    asyncio.create_task(warm_up_task())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    passwords.shutdown()
+
+def require_ready():
+    # Graph-backed routes would answer from an empty index until warm-up loads it
+    if not app_state["ready"]:
+        raise HTTPException(503, "Warming up")
+
+# --- Routes: Ops ---
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return metrics.metrics_endpoint()
+
+@app.get("/health/live", include_in_schema=False)
+def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready", include_in_schema=False)
+def health_ready():
+    require_ready()
+    try:
+        with database.engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+    except Exception:
+        raise HTTPException(503, "Database unreachable")
+    return {"status": "ready"}
 
 # --- Routes: Auth ---
-@app.post("/auth/signup", response_model=schemas.UserResponse)
-def signup(user_data: schemas.UserSignup, db: Session = Depends(get_db)):
+# The auth routes are async so bcrypt can be awaited on the process pool; their
+# blocking DB calls are pushed to the threadpool to keep them off the event loop.
+def find_user_by_email(db: Session, email: str):
+    return db.query(models.User).filter_by(email=email).first()
+
+def check_signup(db: Session, user_data: schemas.UserSignup):
     # Invite Check
     if not user_data.invite_token:
         raise HTTPException(400, "Invite token required")
@@ -223,8 +376,6 @@ def signup(user_data: schemas.UserSignup, db: Session = Depends(get_db)):
     if db.query(models.User).filter_by(email=user_data.email).first():
         raise HTTPException(400, "Email exists")
     
-    # CR Data Fetch
-    cr_name = "New User"
     clean_tag = None
     if user_data.player_tag:
         clean_tag = user_data.player_tag.upper()
@@ -233,34 +384,51 @@ def signup(user_data: schemas.UserSignup, db: Session = Depends(get_db)):
         # Check uniqueness
         if db.query(models.User).filter_by(player_tag=clean_tag).first():
             raise HTTPException(400, "Tag already registered")
-            
-        info = fetch_cr_player(clean_tag)
-        if info: cr_name = info.get("name", cr_name)
+    return invite, clean_tag
 
-    new_user = models.User(
-        email=user_data.email,
-        username=cr_name,
-        player_tag=clean_tag,
-        hashed_password=get_hash(user_data.password)
-    )
+def create_user(db: Session, invite: models.Invite, new_user: models.User):
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
     
     # Auto-friend inviter
-    u1, u2 = sorted([new_user.id, invite.creator_id])
-    if u1 != u2:
-        db.add(models.Friendship(user_id_1=u1, user_id_2=u2))
+    if new_user.id != invite.creator_id:
         invite.used_count += 1
-        db.commit()
-        
+        add_friendship(db, new_user.id, invite.creator_id)
+        db.refresh(new_user)
     return new_user
 
+@app.post("/auth/signup", response_model=schemas.UserResponse)
+async def signup(user_data: schemas.UserSignup, db: Session = Depends(get_db)):
+    invite, clean_tag = await run_in_threadpool(check_signup, db, user_data)
+    
+    # CR Data Fetch
+    cr_name = "New User"
+    if clean_tag:
+        info = await asyncio.to_thread(fetch_cr_player, clean_tag)
+        if info: cr_name = info.get("name", cr_name)
+
+    new_user = models.User(
+        email=user_data.email,
+        username=cr_name,
+        player_tag=clean_tag,
+        hashed_password=await passwords.hash_password(user_data.password)
+    )
+    return await run_in_threadpool(create_user, db, invite, new_user)
+
 @app.post("/auth/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(email=form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(find_user_by_email, db, form_data.username)
+    if not user:
+        raise HTTPException(401, "Bad credentials")
+    ok, new_hash = await passwords.verify_password(form_data.password, user.hashed_password)
+    if not ok:
         raise HTTPException(401, "Bad credentials")
+
+    # Transparent upgrade when BCRYPT_ROUNDS changed since this hash was made
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
     
     token = create_token({"sub": user.email}, timedelta(days=7))
     return {"access_token": token, "token_type": "bearer"}
@@ -269,6 +437,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 async def forgot_password(req: schemas.PasswordResetRequest, tasks: BackgroundTasks, db: Session = Depends(get_db)):
     user = db.query(models.User).filter_by(email=req.email).first()
     if user:
+        from fastapi_mail import FastMail, MessageSchema, MessageType
         reset_token = create_token({"sub": user.email, "type": "reset"}, timedelta(minutes=15))
         link = f"{FRONTEND_URL}/reset-password?token={reset_token}"
         
@@ -279,7 +448,7 @@ async def forgot_password(req: schemas.PasswordResetRequest, tasks: BackgroundTa
             subtype=MessageType.html
         )
         try:
-            fm = FastMail(mail_conf)
+            fm = FastMail(get_mail_conf())
             tasks.add_task(fm.send_message, msg)
         except Exception as e:
             print(f"Mail failed: {e}")
@@ -287,7 +456,8 @@ async def forgot_password(req: schemas.PasswordResetRequest, tasks: BackgroundTa
     return {"message": "If account exists, email sent"}
 
 @app.post("/auth/reset-password")
-def reset_password(req: schemas.PasswordResetConfirm, db: Session = Depends(get_db)):
+async def reset_password(req: schemas.PasswordResetConfirm, db: Session = Depends(get_db)):
+    from jose import jwt
     try:
         payload = jwt.decode(req.token, SECRET_KEY, algorithms=[ALGORITHM])
         if payload.get("type") != "reset": raise Exception()
@@ -295,11 +465,11 @@ def reset_password(req: schemas.PasswordResetConfirm, db: Session = Depends(get_
     except:
         raise HTTPException(400, "Invalid token")
         
-    user = db.query(models.User).filter_by(email=email).first()
+    user = await run_in_threadpool(find_user_by_email, db, email)
     if not user: raise HTTPException(404, "User not found")
     
-    user.hashed_password = get_hash(req.new_password)
-    db.commit()
+    user.hashed_password = await passwords.hash_password(req.new_password)
+    await run_in_threadpool(db.commit)
     return {"message": "Password updated"}
 
 # --- Routes: Core ---
@@ -315,35 +485,45 @@ def get_matches(current: models.User = Depends(get_current_user), db: Session =
             models.Match.player_2_tag == current.player_tag)
     ).order_by(models.Match.battle_time.desc()).limit(50).all()
 
-# Manual Sync Rate Limit
-sync_cooldowns = {}
-
 @app.post("/sync/{player_tag}")
-async def force_sync(player_tag: str, db: Session = Depends(get_db)):
+def force_sync(player_tag: str, db: Session = Depends(get_db)):
     tag = player_tag.upper()
     if not tag.startswith("#"): tag = f"#{tag}"
     
-    last = sync_cooldowns.get(tag)
-    if last and (datetime.now() - last).seconds < 120:
-        raise HTTPException(429, "Wait 2 mins")
-    
-    user = db.query(models.User).filter_by(player_tag=tag).first()
-    if not user: raise HTTPException(404, "User not found")
-    
-    sync_cooldowns[tag] = datetime.now()
-    
-    # Refresh Profile
-    data = fetch_cr_player(tag)
-    if data:
-        user.username = data.get("name", user.username)
-        user.trophies = data.get("trophies", user.trophies)
-        db.commit()
+    if not db.query(models.User.id).filter_by(player_tag=tag).first():
+        raise HTTPException(404, "User not found")
     
-    # Run Sync
-    all_tags = {u.player_tag for u in db.query(models.User).filter(models.User.player_tag != None).all()}
-    await sync_user_matches(db, user, all_tags)
+    job, created = sync_queue.enqueue(db, tag)
+    if not job:
+        raise HTTPException(429, "Wait 2 mins")
     
-    return {"status": "synced"}
+    return {"status": job.status, "job_id": job.id, "coalesced": not created}
+
+@app.get("/sync/jobs/{job_id}")
+def get_sync_job(job_id: int, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = db.query(models.SyncJob).filter_by(id=job_id).first()
+    # Only your own tag's jobs; ids are sequential
+    if not job or job.player_tag != current.player_tag: raise HTTPException(404, "Not found")
+    return {"job_id": job.id, "status": job.status, "new_matches": job.new_matches}
+
+@app.get("/stats/h2h", response_model=List[schemas.PairStatsResponse])
+def get_h2h_stats(current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not current.player_tag: return []
+    rows = db.query(models.PairStat).filter_by(player_tag=current.player_tag).order_by(models.PairStat.games.desc()).all()
+    rows = [stats_engine.rebuild_pair(db, r.player_tag, r.opponent_tag, commit=False) if r.needs_rebuild else r for r in rows]
+    # Build responses before the single commit, which would expire every row
+    out = [stats_engine.to_response(r) for r in rows]
+    db.commit()
+    return out
+
+@app.get("/stats/h2h/{opponent_tag}", response_model=schemas.PairStatsResponse)
+def get_h2h_pair(opponent_tag: str, last_n: int = 10, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not current.player_tag: raise HTTPException(400, "No tag linked")
+    tag = opponent_tag.upper()
+    if not tag.startswith("#"): tag = f"#{tag}"
+    row = stats_engine.get_pair(db, current.player_tag, tag)
+    if not row: raise HTTPException(404, "No matches against this player")
+    return stats_engine.to_response(row, min(max(last_n, 1), stats_engine.LAST_N))
 
 @app.put("/users/link-tag")
 def link_tag(req: schemas.LinkTagRequest, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -380,7 +560,7 @@ def create_invite(req: schemas.InviteCreate, current: models.User = Depends(get_
     db.commit()
     return {"token": token, "target_tag": inv.target_tag, "creator_username": current.username}
 
-@app.get("/search/player")
+@app.get("/search/player", dependencies=[Depends(require_ready)])
 def search(query: str, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     q = query.strip().upper()
     if not q.startswith("#"): q = f"#{q}"
@@ -388,8 +568,7 @@ def search(query: str, current: models.User = Depends(get_current_user), db: Ses
     # Check DB first
     user = db.query(models.User).filter_by(player_tag=q).first()
     if user:
-        u1, u2 = sorted([current.id, user.id])
-        is_friend = db.query(models.Friendship).filter_by(user_id_1=u1, user_id_2=u2).first() is not None
+        is_friend = friend_graph.are_friends(current.id, user.id)
         return {"status": "friend" if is_friend else "user_found", "user": user, "can_invite": False}
     
     # Check CR API
@@ -404,21 +583,28 @@ def add_friend(payload: dict = Body(...), current: models.User = Depends(get_cur
     target_id = payload.get("user_id_2")
     if not target_id: raise HTTPException(400, "Missing ID")
     
-    u1, u2 = sorted([current.id, target_id])
-    if u1 == u2: return {"status": "error"}
-    
-    if not db.query(models.Friendship).filter_by(user_id_1=u1, user_id_2=u2).first():
-        db.add(models.Friendship(user_id_1=u1, user_id_2=u2))
-        db.commit()
+    if not add_friendship(db, current.id, target_id): return {"status": "error"}
     return {"status": "success"}
 
-@app.get("/users/{uid}/friends")
+@app.get("/users/{uid}/friends", dependencies=[Depends(require_ready)])
 def get_friends(uid: int, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if uid != current.id: raise HTTPException(403, "Forbidden")
-    fs = db.query(models.Friendship).filter(or_(models.Friendship.user_id_1 == uid, models.Friendship.user_id_2 == uid)).all()
-    ids = [f.user_id_2 if f.user_id_1 == uid else f.user_id_1 for f in fs]
+    ids = friend_graph.friends_of(uid)
+    if not ids: return []
     return db.query(models.User).filter(models.User.id.in_(ids)).all()
 
+@app.get("/users/{uid}/suggestions", dependencies=[Depends(require_ready)])
+def get_friend_suggestions(uid: int, current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    if uid != current.id: raise HTTPException(403, "Forbidden")
+    ranked = friend_graph.suggestions(uid)
+    if not ranked: return []
+    users = {u.id: u for u in db.query(models.User).filter(models.User.id.in_([i for i, _ in ranked]))}
+    return [
+        {"id": i, "username": users[i].username, "player_tag": users[i].player_tag,
+         "trophies": users[i].trophies, "mutual_friends": n}
+        for i, n in ranked if i in users
+    ]
+
 @app.post("/feedback", response_model=schemas.FeedbackResponse)
 def create_feedback(
     feedback: schemas.FeedbackCreate, 
@@ -435,4 +621,37 @@ def create_feedback(
     db.add(db_feedback)
     db.commit()
     db.refresh(db_feedback)
-    return db_feedback
\ No newline at end of file
+    return db_feedback
+
+# --- Routes: Analytics (optional) ---
+def get_analytics_store():
+    if not ANALYTICS_DIR: raise HTTPException(503, "Analytics disabled")
+    import analytics
+    return analytics.get_store()
+
+def scope_tags(scope: str, current: models.User, db: Session):
+    # None means every tag; "friends" is the caller plus their friends
+    if scope == "all": return None
+    if scope != "friends": raise HTTPException(400, "scope must be 'friends' or 'all'")
+    ids = friend_graph.friends_of(current.id) | {current.id}
+    return [t for (t,) in db.query(models.User.player_tag).filter(
+        models.User.id.in_(ids), models.User.player_tag != None)]
+
+@app.get("/analytics/top-pairs", dependencies=[Depends(require_ready)])
+def analytics_top_pairs(scope: str = "friends", limit: int = 10, since: Optional[int] = None,
+                        current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    store = get_analytics_store()
+    return store.top_pairs(min(max(limit, 1), 100), scope_tags(scope, current, db), since)
+
+@app.get("/analytics/modes", dependencies=[Depends(require_ready)])
+def analytics_modes(scope: str = "friends", since: Optional[int] = None,
+                    current: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    store = get_analytics_store()
+    return store.mode_popularity(scope_tags(scope, current, db), since)
+
+@app.get("/analytics/players/{player_tag}")
+def analytics_player(player_tag: str, since: Optional[int] = None, current: models.User = Depends(get_current_user)):
+    store = get_analytics_store()
+    tag = player_tag.upper()
+    if not tag.startswith("#"): tag = f"#{tag}"
+    return store.player_summary(tag, since)
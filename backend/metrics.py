@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter as TallyCounter
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+from fastapi import Request, Response
+
+# --- Metric Definitions ---
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route",
+    ["method", "route", "status"],
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements executed per request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per request", ["route"],
+)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of individual SQL statements")
+CR_API_LATENCY = Histogram(
+    "cr_api_request_duration_seconds", "Upstream Clash Royale API latency", ["endpoint"],
+)
+CR_API_RESPONSES = Counter(
+    "cr_api_responses_total", "Upstream Clash Royale API responses", ["endpoint", "status"],
+)
+SYNC_SWEEP_DURATION = Histogram(
+    "sync_sweep_duration_seconds", "Wall time of one background sync sweep (all tags due at wake-up)",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200),
+)
+SYNC_MATCHES_INSERTED = Histogram(
+    "sync_matches_inserted", "New matches inserted per sweep",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+PASSWORD_QUEUE_DEPTH = Gauge("password_queue_depth", "bcrypt jobs queued or running in the process pool")
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_op_duration_seconds", "bcrypt verify/hash time including queueing", ["op"],
+)
+PASSWORD_REJECTED = Counter(
+    "password_ops_rejected_total", "bcrypt jobs refused because the queue was full", ["op"],
+)
+
+# [query_count, seconds] for the request currently executing, if any
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+# --- SQLAlchemy Hooks ---
+def instrument_engine(engine):
+    # The start time rides on the execution context, so a statement that errors
+    # out can't leave anything behind on the pooled connection
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_start", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+# --- HTTP Middleware ---
+async def metrics_middleware(request: Request, call_next):
+    stats = [0, 0.0]
+    token = _request_db.set(stats)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        _request_db.reset(token)
+        # Label by route template (/users/{uid}/friends), not the raw path
+        route = request.scope.get("route")
+        path = route.path if route else "unmatched"
+        HTTP_LATENCY.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+        DB_QUERIES.labels(path).observe(stats[0])
+        DB_TIME.labels(path).observe(stats[1])
+
+def metrics_endpoint():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# --- Upstream API ---
+def record_cr_call(endpoint: str, started: float, status):
+    CR_API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    CR_API_RESPONSES.labels(endpoint, str(status)).inc()
+
+# --- Sampling Profiler ---
+class SyncProfiler:
+    """
+    Samples the stack of the thread that entered it every `interval` seconds
+    and prints the hottest frames on exit. Enabled with SYNC_PROFILE=1.
+    """
+    def __init__(self, interval: float = 0.01, top: int = 15):
+        self.enabled = os.getenv("SYNC_PROFILE", "0") == "1"
+        self.interval = interval
+        self.top = top
+        self.samples = TallyCounter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            depth = 0
+            while frame is not None and depth < 8:
+                code = frame.f_code
+                self.samples[f"{code.co_filename}:{frame.f_lineno} {code.co_name}"] += 1
+                frame = frame.f_back
+                depth += 1
+
+    def __enter__(self):
+        if self.enabled:
+            self._target = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            print(f"📊 Sync profile ({sum(self.samples.values())} samples):")
+            for frame, n in self.samples.most_common(self.top):
+                print(f"   {n:>6}  {frame}")
+        return False
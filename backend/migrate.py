@@ -0,0 +1,90 @@
+"""
+Explicit schema migration. The API no longer touches the schema at import time;
+the backend image runs this before uvicorn on every deploy (AUTO_MIGRATE=1
+does the same from inside the app, e.g. for `uvicorn --reload`).
+
+Usage:
+    python migrate.py   # retries an unreachable DB for MIGRATE_TIMEOUT seconds (default 120)
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import OperationalError
+
+import models
+import database
+
+# create_all only creates missing tables; constraints added to existing
+# tables after the fact are applied here, idempotently.
+POST_CREATE_SQL = [
+    # Drop duplicate friendships so unique_friendship can be added
+    """
+    DELETE FROM friendships a USING friendships b
+    WHERE a.id > b.id AND a.user_id_1 = b.user_id_1 AND a.user_id_2 = b.user_id_2
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'unique_friendship') THEN
+            ALTER TABLE friendships ADD CONSTRAINT unique_friendship UNIQUE (user_id_1, user_id_2);
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'no_self_friending') THEN
+            ALTER TABLE friendships ADD CONSTRAINT no_self_friending CHECK (user_id_1 != user_id_2);
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_friendships_user_2 ON friendships (user_id_2)",
+    "ALTER TABLE sync_checkpoints ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ",
+]
+
+REQUIRED_CONSTRAINTS = ("unique_friendship", "no_self_friending")
+
+def missing_schema(engine=None) -> list[str]:
+    """Tables/constraints the app needs that this database doesn't have yet."""
+    engine = engine or database.engine
+    existing = set(inspect(engine).get_table_names())
+    missing = [t for t in models.Base.metadata.tables if t not in existing]
+    with engine.connect() as conn:
+        found = {r[0] for r in conn.execute(
+            text("SELECT conname FROM pg_constraint WHERE conname = ANY(:names)"),
+            {"names": list(REQUIRED_CONSTRAINTS)},
+        )}
+    return missing + [c for c in REQUIRED_CONSTRAINTS if c not in found]
+
+def run_migrations(engine=None):
+    engine = engine or database.engine
+    had_pair_stats = inspect(engine).has_table(models.PairStat.__tablename__)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for stmt in POST_CREATE_SQL:
+            conn.execute(text(stmt))
+
+    # A freshly created pair_stats would otherwise only ever see new matches
+    if not had_pair_stats:
+        import stats_engine
+        from sqlalchemy.orm import Session
+        with Session(bind=engine) as db:
+            print(f"📈 Backfilled head-to-head stats for {stats_engine.rebuild_all(db)} pairs")
+
+def run_migrations_with_retry(timeout: float = 120):
+    # Same backoff as the app's warm-up: a DB that is still starting shouldn't fail the deploy
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while True:
+        try:
+            return run_migrations()
+        except OperationalError as e:
+            if time.monotonic() + delay > deadline:
+                raise
+            print(f"⚠️  Database unreachable ({e.orig}). Retrying in {delay}s.")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+if __name__ == "__main__":
+    try:
+        run_migrations_with_retry(float(os.getenv("MIGRATE_TIMEOUT", 120)))
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+    print("✅ Schema up to date.")
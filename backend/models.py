@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Boolean, DateTime, ForeignKey, Table, UniqueConstraint, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from sqlalchemy.sql import func
@@ -35,6 +35,12 @@ class Friendship(Base):
     user_id_1 = Column(Integer, ForeignKey("users.id"))
     user_id_2 = Column(Integer, ForeignKey("users.id"))
 
+    __table_args__ = (
+        UniqueConstraint('user_id_1', 'user_id_2', name='unique_friendship'),
+        CheckConstraint('user_id_1 != user_id_2', name='no_self_friending'),
+        Index('idx_friendships_user_2', 'user_id_2'),
+    )
+
 class Match(Base):
     __tablename__ = "matches"
     
@@ -58,4 +64,50 @@ class Feedback(Base):
     feedback_type = Column(String(50), nullable=False) # 'bug', 'feature', 'other'
     title = Column(String(100), nullable=False)
     description = Column(String(1000), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class SyncCooldown(Base):
+    __tablename__ = "sync_cooldowns"
+
+    player_tag = Column(String(15), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_tag = Column(String(15), nullable=False, index=True)
+    status = Column(String(16), nullable=False, default="queued", index=True) # queued, running, done, failed
+    new_matches = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class PairStat(Base):
+    __tablename__ = "pair_stats"
+
+    # One row per direction: stats for player_tag against opponent_tag
+    player_tag = Column(String(15), primary_key=True)
+    opponent_tag = Column(String(15), primary_key=True)
+    games = Column(Integer, default=0, nullable=False)
+    wins = Column(Integer, default=0, nullable=False)
+    losses = Column(Integer, default=0, nullable=False)
+    draws = Column(Integer, default=0, nullable=False)
+    current_streak = Column(Integer, default=0, nullable=False) # +n wins / -n losses in a row
+    best_streak = Column(Integer, default=0, nullable=False)
+    recent = Column(BigInteger, default=0, nullable=False) # 2-bit result codes, newest in the low bits
+    ewma_win_rate = Column(Float, default=0.5, nullable=False)
+    ewma_crown_diff = Column(Float, default=0.0, nullable=False)
+    last_battle_time = Column(DateTime, nullable=True) # naive UTC, like Match.battle_time
+    needs_rebuild = Column(Boolean, default=False, nullable=False)
+
+class SyncCheckpoint(Base):
+    __tablename__ = "sync_checkpoints"
+
+    player_tag = Column(String(15), primary_key=True)
+    last_attempt_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True) # sweep lease; keeps workers off each other's tags
+    last_success_at = Column(DateTime(timezone=True), nullable=True)
+    last_result = Column(String(16), nullable=True) # ok, rate_limited, http_error, error
+    new_battles = Column(Integer, default=0)
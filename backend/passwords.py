@@ -0,0 +1,89 @@
+import os
+import asyncio
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from fastapi import HTTPException
+
+import metrics
+
+# bcrypt work happens in a separate process pool so login spikes can't starve
+# the threadpool that serves the sync routes.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", 2))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", 64))
+
+# Hashes made with other rounds are flagged "deprecated" and rehashed on login.
+# Built lazily: passlib is only needed by the pool workers and seeding scripts.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_pool = None
+_pending = 0
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process already runs threads by the time
+        # the first login arrives, and forking those is unsafe
+        _pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _reset_pool(broken):
+    # A dead worker (OOM kill, segfault) breaks the executor for good
+    global _pool
+    if _pool is broken:
+        _pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+# --- Worker functions (run in child processes) ---
+def _verify_and_update(plain, hashed):
+    return get_pwd_context().verify_and_update(plain, hashed)
+
+def _hash(plain):
+    return get_pwd_context().hash(plain)
+
+async def _submit(op: str, fn, *args):
+    global _pending
+    if _pending >= PASSWORD_QUEUE_LIMIT:
+        metrics.PASSWORD_REJECTED.labels(op).inc()
+        raise HTTPException(503, "Server busy, try again shortly")
+
+    _pending += 1
+    metrics.PASSWORD_QUEUE_DEPTH.set(_pending)
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        pool = _get_pool()
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            print("⚠️  Password pool broken, restarting it")
+            _reset_pool(pool)
+            return await loop.run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _pending -= 1
+        metrics.PASSWORD_QUEUE_DEPTH.set(_pending)
+        metrics.PASSWORD_HASH_SECONDS.labels(op).observe(time.perf_counter() - started)
+
+# --- Public API ---
+async def verify_password(plain: str, hashed: str):
+    """Returns (ok, new_hash). new_hash is set when the stored hash should be upgraded."""
+    if not hashed:
+        return False, None
+    return await _submit("verify", _verify_and_update, plain, hashed)
+
+async def hash_password(plain: str) -> str:
+    return await _submit("hash", _hash, plain)
@@ -66,6 +66,20 @@ class MatchResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class PairStatsResponse(BaseModel):
+    player_tag: str
+    opponent_tag: str
+    games: int
+    wins: int
+    losses: int
+    draws: int
+    current_streak: int
+    best_streak: int
+    form: str
+    ewma_win_rate: float
+    crown_diff_trend: float
+    last_battle_time: Optional[datetime] = None
+
 # --- Feedback ---
 class FeedbackCreate(BaseModel):
     feedback_type: str
@@ -0,0 +1,219 @@
+from datetime import timezone
+
+from sqlalchemy import tuple_, or_, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import models
+
+# Rolling head-to-head state per (player, opponent) pair. Each new match is an
+# O(1) update of the stored row, so reads never scan match history. A match
+# older than the pair's last_battle_time can't be folded in incrementally; the
+# pair is flagged and rebuilt from `matches` the next time it is read.
+
+LAST_N = 20           # results kept in the `recent` ring
+EWMA_ALPHA = 0.2      # weight of the newest result in the moving averages
+
+WIN, LOSS, DRAW = 3, 1, 2 # 2-bit codes; 0 marks an empty slot
+RESULT_CHARS = {WIN: "W", LOSS: "L", DRAW: "D"}
+RECENT_MASK = (1 << (2 * LAST_N)) - 1
+
+FIELDS = ("games", "wins", "losses", "draws", "current_streak", "best_streak",
+          "recent", "ewma_win_rate", "ewma_crown_diff", "last_battle_time")
+
+class PairState:
+    __slots__ = FIELDS
+
+    def __init__(self):
+        self.games = self.wins = self.losses = self.draws = 0
+        self.current_streak = self.best_streak = 0
+        self.recent = 0
+        self.ewma_win_rate = 0.5
+        self.ewma_crown_diff = 0.0
+        self.last_battle_time = None
+
+    def apply(self, my_crowns: int, their_crowns: int, battle_time):
+        if my_crowns > their_crowns:
+            result = WIN
+            self.wins += 1
+            self.current_streak = self.current_streak + 1 if self.current_streak > 0 else 1
+            self.best_streak = max(self.best_streak, self.current_streak)
+        elif my_crowns < their_crowns:
+            result = LOSS
+            self.losses += 1
+            self.current_streak = self.current_streak - 1 if self.current_streak < 0 else -1
+        else:
+            result = DRAW
+            self.draws += 1
+            self.current_streak = 0
+
+        self.games += 1
+        self.recent = ((self.recent << 2) | result) & RECENT_MASK
+        won = 1.0 if result == WIN else (0.5 if result == DRAW else 0.0)
+        self.ewma_win_rate += EWMA_ALPHA * (won - self.ewma_win_rate)
+        self.ewma_crown_diff += EWMA_ALPHA * ((my_crowns - their_crowns) - self.ewma_crown_diff)
+        self.last_battle_time = battle_time
+
+def decode_recent(recent: int, n: int = LAST_N) -> str:
+    """Newest-first result string, e.g. 'WWLDW'."""
+    out = []
+    for _ in range(n):
+        code = recent & 3
+        if not code:
+            break
+        out.append(RESULT_CHARS[code])
+        recent >>= 2
+    return "".join(out)
+
+def _naive_utc(dt):
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _load_state(row: models.PairStat) -> PairState:
+    st = PairState()
+    for f in FIELDS:
+        setattr(st, f, getattr(row, f))
+    return st
+
+def _store_state(row: models.PairStat, st: PairState):
+    for f in FIELDS:
+        setattr(row, f, getattr(st, f))
+
+def _directed(m: dict):
+    # Both perspectives of one match: (player, opponent, my_crowns, their_crowns)
+    yield m["player_1_tag"], m["player_2_tag"], m["crowns_1"], m["crowns_2"]
+    yield m["player_2_tag"], m["player_1_tag"], m["crowns_2"], m["crowns_1"]
+
+# --- Incremental ---
+def record_matches(db: Session, matches: list[dict]):
+    """
+    Folds newly inserted matches (dicts keyed like models.Match) into pair_stats.
+    Doesn't commit: call it in the transaction that inserts the matches, so a
+    failure rolls both back instead of stranding matches outside pair_stats.
+    """
+    if not matches:
+        return
+    matches = sorted(matches, key=lambda m: _naive_utc(m["battle_time"]))
+    keys = sorted({(p, o) for m in matches for p, o, _, _ in _directed(m)})
+
+    # Create missing rows first so concurrent workers never race on the INSERT,
+    # then lock them all (in key order, to avoid deadlocks) for the update. A
+    # new row may still have older history in `matches`, so it starts flagged
+    # and its first read rebuilds it (this batch included).
+    blank = {f: getattr(PairState(), f) for f in FIELDS}
+    db.execute(pg_insert(models.PairStat).values([
+        dict(blank, player_tag=p, opponent_tag=o, needs_rebuild=True) for p, o in keys
+    ]).on_conflict_do_nothing())
+    rows = {
+        (r.player_tag, r.opponent_tag): r
+        for r in db.query(models.PairStat).filter(
+            tuple_(models.PairStat.player_tag, models.PairStat.opponent_tag).in_(keys),
+        ).order_by(models.PairStat.player_tag, models.PairStat.opponent_tag).with_for_update()
+    }
+    states = {k: _load_state(r) for k, r in rows.items()}
+
+    for m in matches:
+        bt = _naive_utc(m["battle_time"])
+        for p, o, mine, theirs in _directed(m):
+            row = rows[(p, o)]
+            if row.needs_rebuild:
+                continue
+            st = states[(p, o)]
+            if st.last_battle_time is not None and bt < st.last_battle_time:
+                row.needs_rebuild = True
+                continue
+            st.apply(mine, theirs, bt)
+
+    for key, st in states.items():
+        row = rows[key]
+        if not row.needs_rebuild:
+            _store_state(row, st)
+
+# --- Rebuild ---
+def _iter_pair_matches(db: Session, filters=()):
+    q = db.query(
+        models.Match.player_1_tag, models.Match.player_2_tag,
+        models.Match.crowns_1, models.Match.crowns_2, models.Match.battle_time,
+    ).filter(*filters).order_by(models.Match.battle_time, models.Match.id)
+    return q.yield_per(10_000)
+
+def rebuild_pair(db: Session, player_tag: str, opponent_tag: str, commit: bool = True) -> models.PairStat:
+    # Lock the row before scanning, so a sync committing a match for this pair
+    # waits for the rebuild instead of being skipped by it and missed by it
+    db.execute(pg_insert(models.PairStat).values(
+        player_tag=player_tag, opponent_tag=opponent_tag, needs_rebuild=True,
+    ).on_conflict_do_nothing())
+    row = db.query(models.PairStat).filter_by(
+        player_tag=player_tag, opponent_tag=opponent_tag,
+    ).populate_existing().with_for_update().one()
+
+    st = PairState()
+    for p1, p2, c1, c2, bt in _iter_pair_matches(db, [or_(
+        and_(models.Match.player_1_tag == player_tag, models.Match.player_2_tag == opponent_tag),
+        and_(models.Match.player_1_tag == opponent_tag, models.Match.player_2_tag == player_tag),
+    )]):
+        if p1 == player_tag:
+            st.apply(c1 or 0, c2 or 0, bt)
+        else:
+            st.apply(c2 or 0, c1 or 0, bt)
+
+    _store_state(row, st)
+    row.needs_rebuild = False
+    if commit:
+        db.commit()
+    return row
+
+def rebuild_all(db: Session) -> int:
+    """Recomputes every pair in one ordered pass over `matches`. Returns pair count."""
+    states: dict[tuple, PairState] = {}
+    for p1, p2, c1, c2, bt in _iter_pair_matches(db):
+        c1, c2 = c1 or 0, c2 or 0
+        for key, mine, theirs in (((p1, p2), c1, c2), ((p2, p1), c2, c1)):
+            st = states.get(key)
+            if st is None:
+                st = states[key] = PairState()
+            st.apply(mine, theirs, bt)
+
+    db.query(models.PairStat).delete()
+    rows = []
+    for (p, o), st in states.items():
+        row = {f: getattr(st, f) for f in FIELDS}
+        row.update(player_tag=p, opponent_tag=o, needs_rebuild=False)
+        rows.append(row)
+    if rows:
+        db.bulk_insert_mappings(models.PairStat, rows)
+    db.commit()
+    return len(states)
+
+# --- Reads ---
+def get_pair(db: Session, player_tag: str, opponent_tag: str):
+    row = db.get(models.PairStat, (player_tag, opponent_tag))
+    if row is not None and row.needs_rebuild:
+        row = rebuild_pair(db, player_tag, opponent_tag)
+    return row
+
+def to_response(row: models.PairStat, last_n: int = 10) -> dict:
+    return {
+        "player_tag": row.player_tag,
+        "opponent_tag": row.opponent_tag,
+        "games": row.games,
+        "wins": row.wins,
+        "losses": row.losses,
+        "draws": row.draws,
+        "current_streak": row.current_streak,
+        "best_streak": row.best_streak,
+        "form": decode_recent(row.recent, last_n),
+        "ewma_win_rate": round(row.ewma_win_rate, 4),
+        "crown_diff_trend": round(row.ewma_crown_diff, 3),
+        "last_battle_time": row.last_battle_time,
+    }
+
+if __name__ == "__main__":
+    # One-off backfill, e.g. after first deploying pair_stats: python stats_engine.py
+    import database
+    db = database.SessionLocal()
+    try:
+        print(f"📈 Rebuilt head-to-head stats for {rebuild_all(db)} pairs")
+    finally:
+        db.close()
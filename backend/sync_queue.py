@@ -0,0 +1,169 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import models
+
+# Manual syncs are stored as rows in sync_jobs and drained by a worker loop in
+# every process. Cooldowns live in sync_cooldowns so all workers share them
+# and they survive restarts. The background sweep records per-tag progress in
+# sync_checkpoints for the same reason.
+
+SYNC_COOLDOWN = timedelta(minutes=2)
+JOB_RETENTION = timedelta(days=1)
+STALE_RUNNING = timedelta(minutes=10)
+KNOWN_TAGS_TTL = 60 # seconds
+SWEEP_INTERVAL = timedelta(minutes=30) # how stale a tag may get before the sweep refetches it
+SWEEP_GAP = timedelta(minutes=5) # min time between sweeps, so each one batches every tag that fell due meanwhile
+CLAIM_LEASE = timedelta(minutes=5) # longer than a 25-tag batch takes; then a dead worker's tags free up
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# --- Cooldowns ---
+def acquire_cooldown(db: Session, tag: str) -> bool:
+    """
+    Atomically claims the cooldown for tag. False if another claim is still live.
+    Doesn't commit: a concurrent claimer blocks on the row until this transaction ends.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = pg_insert(models.SyncCooldown).values(player_tag=tag, expires_at=now + SYNC_COOLDOWN)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["player_tag"],
+        set_={"expires_at": stmt.excluded.expires_at},
+        where=models.SyncCooldown.expires_at < now,
+    ).returning(models.SyncCooldown.player_tag)
+    return db.execute(stmt).first() is not None
+
+# --- Jobs ---
+def get_active_job(db: Session, tag: str):
+    return db.query(models.SyncJob).filter(
+        models.SyncJob.player_tag == tag,
+        models.SyncJob.status.in_(ACTIVE_STATUSES),
+    ).order_by(models.SyncJob.id.desc()).first()
+
+def enqueue(db: Session, tag: str):
+    """
+    Returns (job, created). Clicks coalesce onto a job still queued or running,
+    even past the cooldown; (None, False) means the tag is cooling down with nothing pending.
+    """
+    job = get_active_job(db, tag)
+    if job:
+        return job, False
+
+    # Cooldown and job commit together, so a click can never see the
+    # cooldown held without the job that goes with it
+    if not acquire_cooldown(db, tag):
+        db.rollback()
+        return get_active_job(db, tag), False
+
+    job = models.SyncJob(player_tag=tag, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job, True
+
+def claim_next(db: Session):
+    """Marks the oldest queued job running and returns (id, player_tag), or None."""
+    row = db.execute(text(
+        "UPDATE sync_jobs SET status = 'running', started_at = now() "
+        "WHERE id = (SELECT id FROM sync_jobs WHERE status = 'queued' "
+        "            ORDER BY id FOR UPDATE SKIP LOCKED LIMIT 1) "
+        "RETURNING id, player_tag"
+    )).first()
+    db.commit()
+    return row
+
+def finish(db: Session, job_id: int, new_matches: int, ok: bool = True):
+    db.query(models.SyncJob).filter_by(id=job_id).update({
+        "status": "done" if ok else "failed",
+        "new_matches": new_matches,
+        "finished_at": datetime.now(timezone.utc),
+    })
+    db.commit()
+
+def evict_expired(db: Session):
+    """TTL cleanup for cooldowns and finished jobs; also fails jobs orphaned by a crash."""
+    now = datetime.now(timezone.utc)
+    db.query(models.SyncCooldown).filter(models.SyncCooldown.expires_at < now).delete()
+    db.query(models.SyncJob).filter(
+        models.SyncJob.status.notin_(ACTIVE_STATUSES),
+        models.SyncJob.finished_at < now - JOB_RETENTION,
+    ).delete(synchronize_session=False)
+    db.query(models.SyncJob).filter(
+        models.SyncJob.status == "running",
+        models.SyncJob.started_at < now - STALE_RUNNING,
+    ).update({"status": "failed", "finished_at": now}, synchronize_session=False)
+    db.commit()
+
+# --- Sweep Checkpoints ---
+def record_checkpoint(db: Session, tag: str, result: str, new_battles: int = 0):
+    """Upserts the per-tag checkpoint so a restarted worker knows what it already covered."""
+    now = datetime.now(timezone.utc)
+    values = {"player_tag": tag, "last_attempt_at": now, "last_result": result,
+              "new_battles": new_battles, "claimed_until": None}
+    if result == "ok":
+        values["last_success_at"] = now
+    stmt = pg_insert(models.SyncCheckpoint).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["player_tag"],
+        set_={k: v for k, v in values.items() if k != "player_tag"},
+    )
+    db.execute(stmt)
+    db.commit()
+
+def register_tags(db: Session):
+    """Adds an empty checkpoint for every tag that doesn't have one, so claim_due_users can lock it."""
+    db.execute(text(
+        "INSERT INTO sync_checkpoints (player_tag, new_battles) "
+        "SELECT player_tag, 0 FROM users WHERE player_tag IS NOT NULL "
+        "ON CONFLICT (player_tag) DO NOTHING"
+    ))
+    db.commit()
+
+def claim_due_users(db: Session, limit: int):
+    """
+    Leases up to `limit` tags not attempted within SWEEP_INTERVAL (longest-waiting
+    first) and returns their users. SKIP LOCKED plus the lease keep concurrent
+    workers apart; last_attempt_at is left to record_checkpoint, so tags a
+    crashed worker claimed but never fetched are due again once the lease lapses.
+    """
+    now = datetime.now(timezone.utc)
+    tags = [t for (t,) in db.execute(text(
+        "UPDATE sync_checkpoints SET claimed_until = :lease_end "
+        "WHERE player_tag IN ("
+        "    SELECT c.player_tag FROM sync_checkpoints c JOIN users u ON u.player_tag = c.player_tag "
+        "    WHERE (c.last_attempt_at IS NULL OR c.last_attempt_at < :cutoff) "
+        "      AND (c.claimed_until IS NULL OR c.claimed_until < :now) "
+        "    ORDER BY c.last_attempt_at ASC NULLS FIRST, u.id "
+        "    LIMIT :limit FOR UPDATE OF c SKIP LOCKED) "
+        "RETURNING player_tag"
+    ), {"now": now, "lease_end": now + CLAIM_LEASE, "cutoff": now - SWEEP_INTERVAL, "limit": limit})]
+    db.commit()
+    if not tags:
+        return []
+    return db.query(models.User).filter(models.User.player_tag.in_(tags)).all()
+
+def next_due_in(db: Session) -> float:
+    """Seconds until the next tag falls due (0 if one already is)."""
+    oldest = db.query(models.SyncCheckpoint.last_attempt_at).join(
+        models.User, models.User.player_tag == models.SyncCheckpoint.player_tag,
+    ).order_by(models.SyncCheckpoint.last_attempt_at.asc().nullsfirst()).first()
+    if not oldest or oldest[0] is None:
+        return 0.0
+    due_at = oldest[0] + SWEEP_INTERVAL
+    return max(0.0, (due_at - datetime.now(timezone.utc)).total_seconds())
+
+# --- Known Tags ---
+_known_tags = set()
+_known_tags_at = 0.0
+
+def get_known_tags(db: Session) -> set:
+    """Registered player tags, cached so each manual sync doesn't rescan users."""
+    global _known_tags, _known_tags_at
+    if time.monotonic() - _known_tags_at > KNOWN_TAGS_TTL:
+        _known_tags = {t for (t,) in db.query(models.User.player_tag).filter(models.User.player_tag != None)}
+        _known_tags_at = time.monotonic()
+    return _known_tags
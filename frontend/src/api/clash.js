@@ -98,6 +98,13 @@ export const api = {
     return response.data;
   },
 
+  getSyncJob: async (jobId, token) => {
+    const response = await client.get(`/sync/jobs/${jobId}`, {
+      headers: getAuthHeader(token)
+    });
+    return response.data;
+  },
+
   getFriends: async (userId, token) => {
     const response = await client.get(`/users/${userId}/friends`, {
       headers: getAuthHeader(token)
@@ -45,7 +45,13 @@ const Dashboard = ({ user, token, onLogout }) => {
   const handleSync = async () => {
     setSyncing(true);
     try {
-      await api.syncBattles(user.player_tag);
+      const job = await api.syncBattles(user.player_tag, token);
+      // Sync runs as a background job; poll briefly until it settles
+      for (let i = 0; i < 15; i++) {
+        const { status } = await api.getSyncJob(job.job_id, token);
+        if (status === 'done' || status === 'failed') break;
+        await new Promise((r) => setTimeout(r, 1000));
+      }
       await fetchData();
     } finally {
       setSyncing(false);
@@ -0,0 +1,80 @@
+"""
+Local stand-in for the Clash Royale API, so load tests never touch the real
+upstream or burn quota. Serves /v1/players/{tag} and /v1/players/{tag}/battlelog.
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+MODES = ["PvP", "friendly", "pathOfLegend", "clanMate"]
+
+class CRStub:
+    def __init__(self, tags, port=0, latency_ms=0, battles=25, seed=1):
+        self.tags = list(tags)
+        self.latency = latency_ms / 1000
+        self.battles = battles
+        self.rnd = random.Random(seed)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parts = unquote(self.path).strip("/").split("/")
+                # v1 / players / #TAG [/ battlelog]
+                if len(parts) < 3 or parts[1] != "players":
+                    return self._send(404, {"reason": "notFound"})
+                tag = parts[2]
+                if len(parts) == 4 and parts[3] == "battlelog":
+                    return self._send(200, stub.battlelog(tag))
+                return self._send(200, stub.player(tag))
+
+            def _send(self, code, body):
+                raw = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def player(self, tag):
+        return {"tag": tag, "name": f"Stub {tag[1:6]}", "trophies": self.rnd.randint(4000, 9000),
+                "clan": {"name": "Stub Clan"}}
+
+    def battlelog(self, tag):
+        now = datetime.now(timezone.utc)
+        opponents = [t for t in self.tags if t != tag] or self.tags
+        out = []
+        for _ in range(self.battles):
+            t = now - timedelta(seconds=self.rnd.randrange(86400))
+            out.append({
+                "type": self.rnd.choice(MODES),
+                "battleTime": t.strftime("%Y%m%dT%H%M%S.000Z"),
+                "team": [{"tag": tag, "crowns": self.rnd.randint(0, 3)}],
+                "opponent": [{"tag": self.rnd.choice(opponents), "crowns": self.rnd.randint(0, 3)}],
+            })
+        return out
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
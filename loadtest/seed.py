@@ -0,0 +1,110 @@
+"""
+Seeds a scratch database with N users, a random friend graph and M matches.
+
+Usage:
+    DATABASE_URL=postgresql://... python loadtest/seed.py --users 500 --matches 200000 --density 0.02 --reset
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from sqlalchemy import insert, text
+
+import models
+import database
+from battlelog import generate_battle_id
+from passwords import get_pwd_context
+from migrate import run_migrations
+
+PASSWORD = "loadtest"
+ALPHABET = "0289PYLQGRJCUV"
+BATCH = 5000
+
+def make_tag(i: int) -> str:
+    # Deterministic, unique, and made of valid tag characters
+    s = ""
+    while True:
+        i, r = divmod(i, len(ALPHABET))
+        s = ALPHABET[r] + s
+        if i == 0:
+            break
+    return "#LT" + s.rjust(6, "0")
+
+def seed(n_users: int, n_matches: int, density: float, reset: bool = False, rnd_seed: int = 42):
+    rnd = random.Random(rnd_seed)
+    run_migrations()
+    hashed = get_pwd_context().hash(PASSWORD) # one hash for everyone; bcrypt per row would dominate
+
+    with database.engine.begin() as conn:
+        if reset:
+            conn.execute(text(
+                "TRUNCATE users, friendships, invites, matches, feedback, sync_jobs, sync_cooldowns, "
+                "pair_stats, sync_checkpoints RESTART IDENTITY CASCADE"
+            ))
+
+        users = [{
+            "username": f"lt_{i}", "player_tag": make_tag(i), "email": f"lt_{i}@loadtest.local",
+            "hashed_password": hashed, "trophies": rnd.randint(4000, 9000),
+        } for i in range(n_users)]
+        ids = []
+        for start in range(0, len(users), BATCH):
+            ids += conn.execute(
+                insert(models.User).returning(models.User.id), users[start:start + BATCH]
+            ).scalars().all()
+        tag_of = {uid: u["player_tag"] for uid, u in zip(ids, users)}
+
+        # Erdos-Renyi-ish graph: every pair is friends with probability `density`
+        pairs = set()
+        expected = int(density * n_users * (n_users - 1) / 2)
+        while len(pairs) < expected:
+            a, b = rnd.sample(ids, 2)
+            pairs.add((min(a, b), max(a, b)))
+        friend_rows = [{"user_id_1": a, "user_id_2": b} for a, b in pairs]
+        for start in range(0, len(friend_rows), BATCH):
+            conn.execute(insert(models.Friendship), friend_rows[start:start + BATCH])
+
+        # Friends play each other far more than strangers
+        pair_list = list(pairs) or [tuple(rnd.sample(ids, 2))]
+        now = datetime.now(timezone.utc)
+        seen = set()
+        rows = []
+        while len(seen) < n_matches:
+            a, b = rnd.choice(pair_list) if rnd.random() < 0.8 else rnd.sample(ids, 2)
+            t = now - timedelta(seconds=rnd.randrange(365 * 86400))
+            t_str = t.strftime("%Y%m%dT%H%M%S.000Z")
+            p1, p2 = tag_of[a], tag_of[b]
+            bid = generate_battle_id(t_str, p1, p2)
+            if bid in seen:
+                continue
+            seen.add(bid)
+            c1, c2 = rnd.randint(0, 3), rnd.randint(0, 3)
+            rows.append({
+                "battle_id": bid, "player_1_tag": p1, "player_2_tag": p2,
+                "winner_tag": p1 if c1 > c2 else (p2 if c2 > c1 else None),
+                "battle_time": t.replace(microsecond=0), "game_mode": rnd.choice(["PvP", "friendly"]),
+                "crowns_1": c1, "crowns_2": c2,
+            })
+            if len(rows) >= BATCH:
+                conn.execute(insert(models.Match), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(models.Match), rows)
+
+    print(f"🌱 Seeded {n_users} users, {len(pairs)} friendships, {n_matches} matches")
+    return [{"id": uid, "email": u["email"], "player_tag": u["player_tag"]} for uid, u in zip(ids, users)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a load-test database")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--matches", type=int, default=50_000)
+    parser.add_argument("--density", type=float, default=0.02, help="Probability any two users are friends")
+    parser.add_argument("--reset", action="store_true", help="Truncate app tables first")
+    args = parser.parse_args()
+    seed(args.users, args.matches, args.density, args.reset)
+
+if __name__ == "__main__":
+    main()